@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Startup benchmark of the zentity package.
+
+Measures, in fresh interpreters, the time needed to import zentity and to
+define a model, i.e. what a CLI or a short-lived worker pays before its first
+query, and compares it with an eager import of records, which zentity used to
+do at import time. No database is needed: the engine is only created by the
+first query.
+
+Usage::
+
+    python benchmarks/startup.py [runs]
+
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+BASELINE = "pass"
+
+EAGER = "import records"
+
+SNIPPETS = {
+    'import zentity': "import zentity",
+    'define repository': """
+import sys
+from dataclasses import dataclass
+from zentity.core import Repository
+
+@dataclass
+class Post:
+    title: str
+    id: int = None
+
+Post.objects = Repository(Post)
+assert 'sqlalchemy' not in sys.modules
+""",
+}
+
+
+def measure(code, runs):
+    """Returns the median wall time of running code in a new interpreter."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(runs=20):
+    """Prints the median startup time of each snippet, as a difference with
+    a bare interpreter and with the eager import of records.
+    """
+    baseline = measure(BASELINE, runs)
+    eager = measure(EAGER, runs)
+    print(f"{'python':<20} {baseline * 1000:8.1f} ms")
+    print(
+        f"{'import records':<20} {eager * 1000:8.1f} ms"
+        f" ({(eager - baseline) * 1000:+.1f} ms over python)"
+    )
+    for name, code in SNIPPETS.items():
+        elapsed = measure(code, runs)
+        print(
+            f"{name:<20} {elapsed * 1000:8.1f} ms"
+            f" ({(elapsed - baseline) * 1000:+.1f} ms over python,"
+            f" {(elapsed - eager) * 1000:+.1f} ms over import records)"
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
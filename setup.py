@@ -11,7 +11,9 @@ with open('README.rst') as readme_file:
 with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
-requirements = ['records', 'mysql-connector-python', ]
+requirements = ['records', ]
+
+extras_requirements = {'mysql': ['mysql-connector-python', ], }
 
 setup_requirements = ['pytest-runner', ]
 
@@ -29,9 +31,10 @@ setup(
     ],
     description="""The zentity Python library is a simple implementation of the
         repository pattern to organize the database access layer in projects
-        not using an ORM. It uses the records library and only supports, at the
-        moment, MySQL.""",
+        not using an ORM. It uses the records library and supports MySQL and
+        SQLite.""",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
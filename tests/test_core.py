@@ -5,12 +5,30 @@
 
 from dataclasses import dataclass
 
-from zentity.core import Repository, model
+import pytest
+
+from zentity import core
+from zentity.core import (
+    Dialect, MySQLDialect, Repository, SQLiteDialect, get_dialect, model
+)
+
+def patch_database(mocker, backend='mysql'):
+    """Patches records.Database with a mock of the given backend."""
+    Database = mocker.patch('records.Database')
+    Database.return_value._engine.dialect.name = backend
+    return Database
+
+@pytest.fixture(autouse=True)
+def isolated_connections():
+    """Prevents databases patched by a test to be reused by the next ones."""
+    core._db_connections.clear()
+    yield
+    core._db_connections.clear()
 
 def test_repository_creates_as_expected(mocker):
     class MyFakeEntity:
         pass
-    mocker.patch('records.Database')
+    patch_database(mocker)
     repository = Repository(MyFakeEntity)
     assert repository.model == MyFakeEntity
     assert repository.model_name == 'MyFakeEntity'
@@ -19,16 +37,27 @@ def test_repository_creates_as_expected(mocker):
 def test_repository_recognizes_table_name_option(mocker):
     class MyFakeEntity:
         table_name = "my_super_table_name"
-    mocker.patch('records.Database')
+    patch_database(mocker)
     repository = Repository(MyFakeEntity)
     assert repository.model_name == 'MyFakeEntity'
     assert repository.table_name == "my_super_table_name"
 
+def test_repository_creates_database_on_first_query(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker)
+    repository = Repository(MyFakeEntity)
+    assert not Database.called
+    repository.get_all()
+    repository.get_all()
+    assert Database.call_count == 1
+
 def test_repository_last_id_returns_id(mocker):
     class MyFakeEntity:
         pass
     ID = 77
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = [{'id': ID}]
     repository = Repository(MyFakeEntity)
     assert repository._last_id == ID
@@ -36,7 +65,7 @@ def test_repository_last_id_returns_id(mocker):
 def test_repository_last_id_returns_none(mocker):
     class MyFakeEntity:
         pass
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = []
     repository = Repository(MyFakeEntity)
     assert repository._last_id is None
@@ -46,19 +75,35 @@ def test_repository_create_generate_correct_sql(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
     repository = Repository(MyFakeEntity)
     instance = repository.create(**PARAMS_DICT)
-    args, kwargs = Database.return_value.query.call_args
-    assert 'INSERT INTO my_fake_entity(id, title, content)' in args[0]
+    args, kwargs = connection.query.call_args
+    assert 'INSERT INTO `my_fake_entity`(`id`, `title`, `content`)' in args[0]
     assert 'VALUES (:id, :title, :content)' in args[0]
 
+def test_repository_create_fills_in_last_id(mocker):
+    PARAMS_DICT = {'title': 'essai', 'content': 'lorem ipsum'}
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.return_value = [{'id': 7}]
+    repository = Repository(MyFakeEntity)
+    instance = repository.create(**PARAMS_DICT)
+    args, kwargs = connection.query.call_args
+    assert 'LAST_INSERT_ID()' in args[0]
+    assert instance.kwargs['id'] == 7
+    assert connection.close.call_count == 1
+
 def test_repository_create_returns_instance(mocker):
     PARAMS_DICT = {'id':1, 'title': 'essai', 'content': 'lorem ipsum'}
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     repository = Repository(MyFakeEntity)
     instance = repository.create(**PARAMS_DICT)
     assert isinstance(instance, MyFakeEntity)
@@ -68,27 +113,31 @@ def test_repository_get_or_create_generate_correct_getallby_sql(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.return_value = [PARAMS_DICT]
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.return_value = [PARAMS_DICT]
     repository = Repository(MyFakeEntity)
     instance = repository.get_or_create(**PARAMS_DICT)
-    args, kwargs = Database.return_value.query.call_args
-    assert 'SELECT * FROM my_fake_entity' in args[0]
-    assert 'WHERE id=:id AND title=:title AND content=:content' in args[0]
+    args, kwargs = connection.query.call_args
+    assert 'SELECT * FROM `my_fake_entity`' in args[0]
+    assert (
+        'WHERE `id`=:id AND `title`=:title AND `content`=:content' in args[0]
+    )
 
 def test_repository_get_or_create_generate_correct_create_sql(mocker):
     PARAMS_DICT = {'id':1, 'title': 'essai', 'content': 'lorem ipsum'}
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.side_effect = [
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.side_effect = [
         [], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT]
     ]
     repository = Repository(MyFakeEntity)
     instance = repository.get_or_create(**PARAMS_DICT)
-    args, kwargs = Database().query.call_args_list[1]
-    assert 'INSERT INTO my_fake_entity(id, title, content)' in args[0]
+    args, kwargs = connection.query.call_args_list[1]
+    assert 'INSERT INTO `my_fake_entity`(`id`, `title`, `content`)' in args[0]
     assert 'VALUES (:id, :title, :content)' in args[0]
 
 def test_repository_get_or_create_generate_correct_create_sql(mocker):
@@ -96,14 +145,15 @@ def test_repository_get_or_create_generate_correct_create_sql(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.side_effect = [
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.side_effect = [
         [], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT]
     ]
     repository = Repository(MyFakeEntity)
     instance = repository.get_or_create(**PARAMS_DICT)
-    args, kwargs = Database.return_value.query.call_args_list[1]
-    assert 'INSERT INTO my_fake_entity(id, title, content)' in args[0]
+    args, kwargs = connection.query.call_args_list[1]
+    assert 'INSERT INTO `my_fake_entity`(`id`, `title`, `content`)' in args[0]
     assert 'VALUES (:id, :title, :content)' in args[0]
 
 def test_repository_get_or_create_generate_correct_getlast_sql(mocker):
@@ -111,33 +161,36 @@ def test_repository_get_or_create_generate_correct_getlast_sql(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.side_effect = [
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.side_effect = [
         [], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT]
     ]
     repository = Repository(MyFakeEntity)
     instance = repository.get_or_create(**PARAMS_DICT)
-    args, kwargs = Database.return_value.query.call_args_list[3]
-    assert 'SELECT * FROM my_fake_entity WHERE id=:id' in args[0]
+    args, kwargs = connection.query.call_args_list[3]
+    assert 'SELECT * FROM `my_fake_entity` WHERE `id`=:id' in args[0]
 
 def test_repository_get_or_create_generate_does_not_create_if_found(mocker):
     PARAMS_DICT = {'id':1, 'title': 'essai', 'content': 'lorem ipsum'}
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.return_value = [PARAMS_DICT]
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.return_value = [PARAMS_DICT]
     repository = Repository(MyFakeEntity)
     instance = repository.get_or_create(**PARAMS_DICT)
-    assert len(Database.return_value.query.call_args_list) == 1
+    assert len(connection.query.call_args_list) == 1
 
 def test_repository_get_or_create_returns_instance_if_found(mocker):
     PARAMS_DICT = {'id':1, 'title': 'essai', 'content': 'lorem ipsum'}
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.return_value = [PARAMS_DICT]
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.return_value = [PARAMS_DICT]
     repository = Repository(MyFakeEntity)
     instance = repository.get_or_create(**PARAMS_DICT)
     assert isinstance(instance, MyFakeEntity)
@@ -147,8 +200,9 @@ def test_repository_get_or_create_returns_instance_if_created(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
-    Database.return_value.query.return_value.all.side_effect = [
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.side_effect = [
         [], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT], [PARAMS_DICT]
     ]
     repository = Repository(MyFakeEntity)
@@ -163,7 +217,7 @@ def test_repository_filter_returns_instances_if_found(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = ROWS
     repository = Repository(MyFakeEntity)
     instances = repository.filter(title='essai', content='lorem')
@@ -175,7 +229,7 @@ def test_repository_filter_returns_empty_list_if_nothing_found(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = ROWS
     repository = Repository(MyFakeEntity)
     instances = repository.filter(title='essai', content='lorem')
@@ -189,7 +243,7 @@ def test_repository_get_returns_instance_if_found(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = ROWS
     repository = Repository(MyFakeEntity)
     instance = repository.get(title='essai', content='lorem')
@@ -200,7 +254,7 @@ def test_repository_get_returns_none_if_nothing_found(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = ROWS
     repository = Repository(MyFakeEntity)
     instance = repository.get(title='essai', content='lorem')
@@ -212,11 +266,12 @@ def test_repository_save_generate_correct_create_sql(mocker):
         title: str
         content: str
         id: int = None
-    Database = mocker.patch('records.Database')
-    repository = Repository(MyFakeEntity)
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    repository = MyFakeEntity.objects = Repository(MyFakeEntity)
     repository.save(MyFakeEntity(title='essai', content='lorem'))
-    args, kwargs = Database.return_value.query.call_args_list[0]
-    assert 'INSERT INTO my_fake_entity(title, content)' in args[0]
+    args, kwargs = connection.query.call_args_list[0]
+    assert 'INSERT INTO `my_fake_entity`(`title`, `content`)' in args[0]
     assert 'VALUES (:title, :content)' in args[0]
     assert kwargs['title'] == 'essai'
     assert kwargs['content'] == 'lorem'
@@ -230,7 +285,7 @@ def test_repository_get_all_returns_instances_if_found(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = ROWS
     repository = Repository(MyFakeEntity)
     instances = repository.get_all()
@@ -242,14 +297,14 @@ def test_repository_get_all_returns_empty_list_if_nothing_found(mocker):
     class MyFakeEntity:
         def __init__(self, **kwargs):
             self.kwargs = kwargs
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
     Database.return_value.query.return_value.all.return_value = ROWS
     repository = Repository(MyFakeEntity)
     instances = repository.get_all()
     assert instances == []
 
 def test_model_decorator_transforms_to_dataclass(mocker):
-    mocker.patch('records.Database')
+    patch_database(mocker)
     @model
     class MyFakeEntity:
         title: str
@@ -263,7 +318,7 @@ def test_model_decorator_transforms_to_dataclass(mocker):
     assert MyFakeEntity.objects.model == MyFakeEntity
 
 def test_model_decorator_save_calls_repository_save(mocker):
-    mocker.patch('records.Database')
+    patch_database(mocker)
     mocker.patch('zentity.core.Repository')
     @model
     class MyFakeEntity:
@@ -275,10 +330,31 @@ def test_model_decorator_save_calls_repository_save(mocker):
     args, kwargs = instance.objects.save.call_args
     assert args[0] == instance
 
+def test_model_decorator_fetches_related_models(mocker):
+    Database = patch_database(mocker)
+    Database.return_value.query.return_value.all.return_value = [
+        {'name': 'author', 'id': 3}
+    ]
+    @model
+    class Author:
+        name: str
+        id: int = None
+    @model
+    class Post:
+        title: str
+        author: Author
+        id: int = None
+    post = Post(title='title', author=3)
+    assert post.author == Author(name='author', id=3)
+    args, kwargs = Database.return_value.query.call_args
+    assert 'SELECT * FROM `author` WHERE `id`=:id' in args[0]
+    assert Post(title='title', author=post.author).author is post.author
+
 def test_repository_get_or_save(mocker):
-    Database = mocker.patch('records.Database')
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
     _create = mocker.patch('zentity.core.Repository._create')
-    Database().query().all.return_value = [
+    connection.query().all.return_value = [
         {'modified': 1, 'not_modified':None, 'a': 'A', 'b': 'B'}
     ]
     @dataclass
@@ -297,3 +373,439 @@ def test_repository_get_or_save(mocker):
     assert not _create.called
     assert inst == instance
 
+
+def test_repository_load_file_inserts_csv_by_chunks(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text("name,content\nA,a\nB,b\nC,c\n")
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    Database.return_value._engine.dialect.name = 'sqlite'
+    repository = Repository(MyFakeEntity)
+    progress = mocker.Mock()
+    stats = repository.load_file(
+        path, mapping={'name': 'title'}, chunk_size=2, progress=progress
+    )
+    calls = connection.bulk_query.call_args_list
+    assert len(calls) == 2
+    args, kwargs = calls[0]
+    assert 'INSERT INTO "my_fake_entity"("title", "content")' in args[0]
+    assert 'VALUES (:title, :content)' in args[0]
+    assert args[1] == [
+        {'title': 'A', 'content': 'a'}, {'title': 'B', 'content': 'b'}
+    ]
+    assert stats.rows == 3
+    assert progress.call_count == 2
+
+def test_repository_load_file_skips_blank_csv_lines(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text("title,content\nA,a\n\nB,b\n")
+    Database = patch_database(mocker, 'sqlite')
+    connection = Database.return_value.get_connection.return_value
+    repository = Repository(MyFakeEntity)
+    stats = repository.load_file(path)
+    args, kwargs = connection.bulk_query.call_args
+    assert args[1] == [
+        {'title': 'A', 'content': 'a'}, {'title': 'B', 'content': 'b'}
+    ]
+    assert stats.rows == 2
+
+@pytest.mark.parametrize('line', ['B', 'B,b,EXTRA'])
+def test_repository_load_file_rejects_ragged_csv_rows(mocker, tmp_path, line):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text(f"title,content\nA,a\n{line}\n")
+    patch_database(mocker, 'sqlite')
+    repository = Repository(MyFakeEntity)
+    with pytest.raises(ValueError, match='Line 3'):
+        repository.load_file(path, chunk_size=1)
+
+def test_repository_load_file_rolls_back_failed_load(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text("title,content\nA,a\nB,b\nC,c,EXTRA\n")
+    Database = patch_database(mocker, 'sqlite')
+    connection = Database.return_value.get_connection.return_value
+    transaction = connection.transaction.return_value
+    repository = Repository(MyFakeEntity)
+    with pytest.raises(ValueError):
+        repository.load_file(path, chunk_size=1)
+    assert connection.bulk_query.call_count == 1
+    transaction.rollback.assert_called_once_with()
+    assert not transaction.commit.called
+
+def test_repository_load_file_inserts_ndjson(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.ndjson"
+    path.write_text(
+        '{"title": "A", "content": "a", "junk": 1}\n\n'
+        '{"title": "B", "content": "b", "junk": 2}\n'
+    )
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    repository = Repository(MyFakeEntity)
+    stats = repository.load_file(path, format='ndjson', mapping={'junk': None})
+    args, kwargs = connection.bulk_query.call_args
+    assert args[1] == [
+        {'title': 'A', 'content': 'a'}, {'title': 'B', 'content': 'b'}
+    ]
+    assert stats.rows == 2
+
+def test_repository_load_file_rejects_unknown_columns(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text("title,unknown\nA,a\n")
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    repository = Repository(MyFakeEntity)
+    with pytest.raises(ValueError):
+        repository.load_file(path)
+    assert not connection.bulk_query.called
+
+def test_repository_load_file_uses_load_data_on_mysql(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text("title,skipped,content\nA,x,a\nB,y,b\n")
+    Database = patch_database(mocker)
+    Database.return_value._engine.dialect.name = 'mysql'
+    engine = Database.return_value.get_engine.return_value
+    connection = engine.begin.return_value.__enter__.return_value
+    connection.execute.return_value.rowcount = 2
+    repository = Repository(MyFakeEntity)
+    stats = repository.load_file(path, mapping={'skipped': None})
+    args, kwargs = connection.execute.call_args
+    assert 'LOAD DATA LOCAL INFILE :path INTO TABLE `my_fake_entity`' in str(
+        args[0]
+    )
+    assert "ESCAPED BY ''" in str(args[0])
+    assert '(`title`, @_skip, `content`)' in str(args[0])
+    assert args[1] == {'path': str(path)}
+    assert not Database.return_value.bulk_query.called
+    assert stats.rows == 2
+
+def test_repository_load_file_rejects_empty_csv_column(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        content: str
+        id: int = None
+    path = tmp_path / "entities.csv"
+    path.write_text("title,content,\nA,a,\n")
+    patch_database(mocker)
+    repository = Repository(MyFakeEntity)
+    with pytest.raises(ValueError):
+        repository.load_file(path)
+
+def test_repository_load_file_rejects_ndjson_non_objects(mocker, tmp_path):
+    @dataclass
+    class MyFakeEntity:
+        title: str
+        id: int = None
+    path = tmp_path / "entities.ndjson"
+    path.write_text('{"title": "A"}\n["B"]\n')
+    patch_database(mocker)
+    repository = Repository(MyFakeEntity)
+    with pytest.raises(ValueError):
+        repository.load_file(path, format='ndjson')
+
+def test_get_dialect_returns_registered_dialects():
+    assert isinstance(get_dialect('sqlite'), SQLiteDialect)
+    assert isinstance(get_dialect('mysql'), MySQLDialect)
+    assert isinstance(get_dialect(None), MySQLDialect)
+
+def test_get_dialect_uses_mysql_dialect_for_mariadb(mocker):
+    class MyFakeEntity:
+        pass
+    Database = patch_database(mocker, 'mariadb')
+    Database.return_value.query.return_value.all.return_value = [{'id': 5}]
+    repository = Repository(MyFakeEntity)
+    assert isinstance(get_dialect('mariadb'), MySQLDialect)
+    assert repository._last_id == 5
+    args, kwargs = Database.return_value.query.call_args
+    assert 'LAST_INSERT_ID()' in args[0]
+
+def test_get_dialect_rejects_unregistered_backend():
+    with pytest.raises(ValueError):
+        get_dialect('mssql')
+
+def test_dialect_requires_last_id_query_and_full_scan_detection():
+    class IncompleteDialect(Dialect):
+        name = 'incomplete'
+    with pytest.raises(TypeError):
+        IncompleteDialect()
+
+def test_dialect_defaults_to_standard_upsert():
+    class PostgreSQLDialect(Dialect):
+        name = 'postgresql'
+        last_id_query = "SELECT lastval() as id"
+        def is_full_scan(self, plan):
+            return any('Seq Scan' in row['QUERY PLAN'] for row in plan)
+    sql = PostgreSQLDialect().upsert('post', ['id', 'title'], ['id'])
+    assert 'ON CONFLICT ("id")' in sql
+    assert 'DO UPDATE SET "title"=excluded."title"' in sql
+
+def test_repository_looks_up_dialect_once(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    patch_database(mocker)
+    lookup = mocker.patch('zentity.core.get_dialect', wraps=get_dialect)
+    repository = Repository(MyFakeEntity)
+    repository.filter(title='essai', content='lorem')
+    repository.get_all()
+    assert lookup.call_count == 1
+
+def test_repository_quotes_reserved_names(mocker):
+    class Order:
+        table_name = 'order'
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker)
+    repository = Repository(Order)
+    repository.filter(key='a')
+    args, kwargs = Database.return_value.query.call_args
+    assert 'SELECT * FROM `order` WHERE `key`=:key' in args[0]
+
+def test_repository_last_id_uses_dialect_query(mocker):
+    class MyFakeEntity:
+        pass
+    Database = patch_database(mocker)
+    Database.return_value._engine.dialect.name = 'sqlite'
+    Database.return_value.query.return_value.all.return_value = [{'id': 3}]
+    repository = Repository(MyFakeEntity)
+    assert repository._last_id == 3
+    args, kwargs = Database.return_value.query.call_args
+    assert 'last_insert_rowid()' in args[0]
+
+def test_dialects_quote_identifiers():
+    assert MySQLDialect().quote('my`table') == '`my``table`'
+    assert SQLiteDialect().quote('my"table') == '"my""table"'
+
+def test_dialects_generate_limit_and_offset():
+    assert MySQLDialect().limit(10, 20) == 'LIMIT 10 OFFSET 20'
+    assert MySQLDialect().limit(offset=5).startswith('LIMIT 1844')
+    assert SQLiteDialect().limit(offset=5) == 'LIMIT -1 OFFSET 5'
+    assert SQLiteDialect().limit() == ''
+
+def test_repository_upsert_generates_mysql_sql(mocker):
+    PARAMS_DICT = {'id': 1, 'title': 'essai'}
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker, 'mysql')
+    connection = Database.return_value.get_connection.return_value
+    repository = Repository(MyFakeEntity)
+    instance = repository.upsert(**PARAMS_DICT)
+    args, kwargs = connection.query.call_args
+    assert 'INSERT INTO `my_fake_entity`' in args[0]
+    assert 'ON DUPLICATE KEY UPDATE `title`=VALUES(`title`)' in args[0]
+    assert kwargs == PARAMS_DICT
+    assert isinstance(instance, MyFakeEntity)
+
+def test_repository_upsert_generates_sqlite_sql(mocker):
+    PARAMS_DICT = {'id': 1, 'title': 'essai'}
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker, 'sqlite')
+    connection = Database.return_value.get_connection.return_value
+    repository = Repository(MyFakeEntity)
+    repository.upsert(**PARAMS_DICT)
+    args, kwargs = connection.query.call_args
+    assert 'ON CONFLICT ("id")' in args[0]
+    assert 'DO UPDATE SET "title"=excluded."title"' in args[0]
+
+def test_repository_shares_database_within_process(mocker):
+    class MyFakeEntity:
+        pass
+    Database = patch_database(mocker)
+    assert Repository(MyFakeEntity)._db is Repository(MyFakeEntity)._db
+    assert Database.call_count == 1
+
+def test_repository_recreates_database_after_fork(mocker):
+    class MyFakeEntity:
+        pass
+    Database = patch_database(mocker)
+    Database.side_effect = [mocker.Mock(), mocker.Mock()]
+    repository = Repository(MyFakeEntity)
+    parent_db = repository._db
+    mocker.patch('os.getpid', return_value=core._db_pid + 1)
+    child_db = repository._db
+    assert child_db is not parent_db
+    parent_db._engine.dispose.assert_called_once_with(close=False)
+
+def test_repository_pins_connection_to_thread(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker)
+    connection = Database.return_value.get_connection.return_value
+    repository = Repository(MyFakeEntity)
+    with repository._connection() as pinned:
+        assert repository._db is pinned
+        with repository._connection() as nested:
+            assert nested is pinned
+    assert Database.return_value.get_connection.call_count == 1
+    assert connection.close.call_count == 1
+    assert repository._db is Database.return_value
+
+def test_repository_pins_connection_without_registry_lock(mocker):
+    class MyFakeEntity:
+        pass
+    patch_database(mocker)
+    repository = Repository(MyFakeEntity)
+    repository._db
+    lock = mocker.patch.object(Repository, 'connection_lock')
+    with repository._connection():
+        pass
+    assert not lock.__enter__.called
+
+def test_repository_pool_metrics(mocker):
+    class MyFakeEntity:
+        pass
+    Database = patch_database(mocker)
+    pool = Database.return_value._engine.pool
+    pool.size.return_value = 5
+    pool.checkedin.return_value = 3
+    pool.checkedout.return_value = 2
+    pool.overflow.return_value = -3
+    repository = Repository(MyFakeEntity)
+    assert repository.pool_metrics() == {
+        'size': 5, 'checked_in': 3, 'checked_out': 2, 'overflow': -3,
+        'waiting': 0,
+    }
+
+def test_repository_records_filters_in_diagnostic_mode(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    patch_database(mocker)
+    repository = Repository(MyFakeEntity)
+    repository.filter(title='essai')
+    assert repository._filters == {}
+    repository.diagnostics = True
+    repository.filter(title='essai', content='lorem')
+    repository.get(content='ipsum', title='essai 2')
+    assert repository._filters == {
+        ('content', 'title'): {
+            'calls': 2, 'params': {'title': 'essai', 'content': 'lorem'}
+        }
+    }
+
+def test_repository_index_report_suggests_index_on_sqlite_scan(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker)
+    Database.return_value._engine.dialect.name = 'sqlite'
+    Database.return_value.query.return_value.all.return_value = [
+        {'id': 2, 'parent': 0, 'notused': 0, 'detail': 'SCAN my_fake_entity'}
+    ]
+    repository = Repository(MyFakeEntity)
+    repository.diagnostics = True
+    repository.filter(title='essai', content='lorem')
+    report = repository.index_report()
+    args, kwargs = Database.return_value.query.call_args
+    assert 'EXPLAIN QUERY PLAN' in args[0]
+    assert kwargs == {'title': 'essai', 'content': 'lorem'}
+    assert report[0].columns == ('content', 'title')
+    assert report[0].full_scan
+    assert report[0].suggested_index == (
+        'CREATE INDEX "idx_my_fake_entity_content_title" '
+        'ON "my_fake_entity" ("content", "title")'
+    )
+
+def test_repository_index_report_accepts_mysql_index_lookup(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker)
+    Database.return_value._engine.dialect.name = 'mysql'
+    Database.return_value.query.return_value.all.return_value = [
+        {'id': 1, 'table': 'my_fake_entity', 'type': 'const', 'key': 'PRIMARY'}
+    ]
+    repository = Repository(MyFakeEntity)
+    repository.diagnostics = True
+    repository.get(id=1)
+    report = repository.index_report()
+    assert not report[0].full_scan
+    assert report[0].suggested_index is None
+
+def test_repository_upsert_uses_conflict_keys_and_saves_nested_models(mocker):
+    class Author:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker, 'sqlite')
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.return_value = [{'id': 9}]
+    Author.objects = Repository(Author)
+    author = Author(id=4)
+    author.id = 4
+    author.get_or_save = mocker.Mock()
+    repository = Repository(MyFakeEntity)
+    instance = repository.upsert(
+        conflict_keys=('title',), title='essai', author=author
+    )
+    args, kwargs = connection.query.call_args_list[0]
+    assert 'ON CONFLICT ("title")' in args[0]
+    assert 'DO UPDATE SET "author_id"=excluded."author_id"' in args[0]
+    assert kwargs == {'title': 'essai', 'author_id': 4}
+    author.get_or_save.assert_called_once_with()
+    args, kwargs = connection.query.call_args_list[1]
+    assert 'SELECT * FROM "my_fake_entity" WHERE "title"=:title' in args[0]
+    assert instance.kwargs['id'] == 9
+
+def test_repository_upsert_fills_in_last_id_without_conflict_keys(mocker):
+    class MyFakeEntity:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+    Database = patch_database(mocker, 'sqlite')
+    connection = Database.return_value.get_connection.return_value
+    connection.query.return_value.all.return_value = [{'id': 7}]
+    repository = Repository(MyFakeEntity)
+    instance = repository.upsert(title='essai')
+    args, kwargs = connection.query.call_args
+    assert 'last_insert_rowid()' in args[0]
+    assert instance.kwargs['id'] == 7
+
+def test_dialect_create_index_shortens_long_names():
+    columns = ['a_rather_long_column_name', 'another_long_column_name']
+    sql = MySQLDialect().create_index('my_fake_entity', columns)
+    name = sql.split('`')[1]
+    assert len(name) == 64
+    assert name.startswith('idx_my_fake_entity_a_rather_long_column_name')
+    assert name != MySQLDialect().create_index(
+        'my_fake_entity', columns[:1] + ['another_long_column_nam']
+    ).split('`')[1]
+    assert '`idx_post_title`' in MySQLDialect().create_index('post', ['title'])
@@ -2,20 +2,283 @@
 
 """Core module of the dababase IO layer package"""
 
+import csv
+import json
+import os
 import re
 import threading
-from dataclasses import dataclass, asdict
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, fields
+from hashlib import sha1
 from inspect import signature
 
-import records
-
 _db_connections = {}
+_db_waiting = {}
+_waiting_lock = threading.Lock()
+_db_pid = os.getpid()
+_db_inherited = []
+_pinned = threading.local()
+_filters_lock = threading.Lock()
+
+
+class Dialect(ABC):
+    """SQL flavour of a database backend.
+
+    Subclasses describe how ids are retrieved, how upserts are written, how
+    identifiers are quoted, how results are paginated and how many rows can be
+    sent at once in bulk inserts. They must define name, last_id_query and
+    is_full_scan, the other members default to standard SQL.
+
+    """
+
+    name = None
+    identifier_quote = '"'
+    max_bulk_rows = 1000
+    supports_load_data = False
+    explain_prefix = "EXPLAIN"
+    max_identifier_length = 63
+
+    @property
+    @abstractmethod
+    def last_id_query(self):
+        """SQL query selecting the last auto-generated ID as id."""
+
+    def quote(self, identifier):
+        """Quotes a table or column name."""
+        quote = self.identifier_quote
+        return f"{quote}{identifier.replace(quote, quote * 2)}{quote}"
+
+    def limit(self, limit=None, offset=None):
+        """Generates SQL line for limit and offset in select queries."""
+        clauses = []
+        if limit is not None:
+            clauses.append(f"LIMIT {int(limit)}")
+        if offset is not None:
+            clauses.append(f"OFFSET {int(offset)}")
+        return " ".join(clauses)
+
+    def upsert(self, table, columns, keys):
+        """Generates SQL query inserting a row or updating the row conflicting
+        on the given keys, which need a unique index.
+        """
+        updates = [col for col in columns if col not in keys]
+        action = "NOTHING"
+        if updates:
+            action = "UPDATE SET " + ", ".join([
+                f"{self.quote(col)}=excluded.{self.quote(col)}"
+                for col in updates
+            ])
+        return f"""
+            INSERT INTO {self.quote(table)}
+            ({", ".join([self.quote(col) for col in columns])})
+            VALUES ({", ".join([f":{col}" for col in columns])})
+            ON CONFLICT ({", ".join([self.quote(col) for col in keys])})
+            DO {action}
+        """
+
+    @abstractmethod
+    def is_full_scan(self, plan):
+        """Tells whether the rows returned by an explained query show a full
+        table scan.
+        """
+
+    def create_index(self, table, columns):
+        """Generates SQL query creating an index on the given columns.
+
+        Names longer than the identifier limit of the backend are truncated
+        and suffixed with a hash of the full name to stay unique.
+        """
+        name = "_".join(['idx', table, *columns])
+        if len(name) > self.max_identifier_length:
+            digest = sha1(name.encode()).hexdigest()[:8]
+            name = f"{name[:self.max_identifier_length - 9]}_{digest}"
+        return (
+            f"CREATE INDEX {self.quote(name)} ON {self.quote(table)} "
+            f"({', '.join([self.quote(col) for col in columns])})"
+        )
+
+
+class MySQLDialect(Dialect):
+    """Dialect of MySQL and MariaDB databases."""
+
+    name = 'mysql'
+    last_id_query = "SELECT LAST_INSERT_ID() as id"
+    identifier_quote = '`'
+    supports_load_data = True
+    max_identifier_length = 64
+
+    def limit(self, limit=None, offset=None):
+        """Generates SQL line for limit and offset in select queries."""
+        if limit is None and offset is not None:
+            # MySQL does not accept an offset without a limit
+            limit = 18446744073709551615
+        return super().limit(limit, offset)
+
+    def upsert(self, table, columns, keys):
+        """Generates SQL query inserting a row or updating the row conflicting
+        on any unique index of the table.
+
+        MySQL cannot restrict the conflict to the given keys, they are only
+        left out of the updated columns.
+        """
+        updates = [col for col in columns if col not in keys] or list(keys)
+        assignments = ", ".join([
+            f"{self.quote(col)}=VALUES({self.quote(col)})" for col in updates
+        ])
+        return f"""
+            INSERT INTO {self.quote(table)}
+            ({", ".join([self.quote(col) for col in columns])})
+            VALUES ({", ".join([f":{col}" for col in columns])})
+            ON DUPLICATE KEY UPDATE {assignments}
+        """
+
+    def is_full_scan(self, plan):
+        """Tells whether the rows returned by an explained query show a full
+        table scan.
+        """
+        return any(row.get('type') == 'ALL' for row in plan)
+
+
+class SQLiteDialect(Dialect):
+    """Dialect of SQLite databases."""
+
+    name = 'sqlite'
+    last_id_query = "SELECT last_insert_rowid() as id"
+    max_bulk_rows = 5000
+    explain_prefix = "EXPLAIN QUERY PLAN"
+
+    def limit(self, limit=None, offset=None):
+        """Generates SQL line for limit and offset in select queries."""
+        if limit is None and offset is not None:
+            # SQLite does not accept an offset without a limit
+            limit = -1
+        return super().limit(limit, offset)
+
+    def is_full_scan(self, plan):
+        """Tells whether the rows returned by an explained query show a full
+        table scan.
+        """
+        # Index lookups are reported as SEARCH, anything read in full as SCAN
+        return any(row.get('detail', '').startswith('SCAN') for row in plan)
+
+
+_dialects = {
+    MySQLDialect.name: MySQLDialect(),
+    SQLiteDialect.name: SQLiteDialect(),
+}
+# SQLAlchemy reports MariaDB URLs under their own backend name
+_dialects['mariadb'] = _dialects[MySQLDialect.name]
+
+
+def register_dialect(dialect):
+    """Registers a dialect instance under its backend name."""
+    _dialects[dialect.name] = dialect
+
+
+def get_dialect(name):
+    """Returns the dialect registered for the given backend name, or the MySQL
+    dialect if no backend name is given.
+
+    Raises:
+        ValueError: if no dialect is registered for the backend.
+
+    """
+    if name is None:
+        return _dialects[MySQLDialect.name]
+    if name not in _dialects:
+        raise ValueError(
+            f"No dialect registered for the {name!r} backend, see "
+            f"register_dialect"
+        )
+    return _dialects[name]
+
+
+@dataclass
+class LoadStats:
+    """Statistics collected while bulk loading a file into a table."""
+
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        """Returns the loading throughput."""
+        if self.seconds:
+            return self.rows / self.seconds
+        return 0.0
+
+
+@dataclass
+class QueryPlan:
+    """Execution plan of the queries filtering a table on a set of columns."""
+
+    table: str
+    columns: tuple
+    calls: int
+    full_scan: bool
+    plan: list
+    suggested_index: str = None
+
+
+def _get_database(key):
+    """Returns the database registered under key for the current process,
+    creating it on first use.
+
+    The pools inherited from a parent process are discarded after a fork, so
+    that each process opens its own connections.
+
+    """
+    global _db_pid
+    if _db_pid == os.getpid() and key in _db_connections:
+        return _db_connections[key]
+    # Deferred to keep records, SQLAlchemy and the database driver out of the
+    # import of models
+    import records
+    with Repository.connection_lock:
+        if _db_pid != os.getpid():
+            for database in _db_connections.values():
+                _discard_inherited(database)
+            _db_connections.clear()
+            with _waiting_lock:
+                _db_waiting.clear()
+            _db_pid = os.getpid()
+        if key not in _db_connections:
+            _db_connections[key] = records.Database()
+        return _db_connections[key]
+
+
+def _discard_inherited(database):
+    """Drops the pool of a database inherited from the parent process without
+    closing the connections the parent is still using.
+    """
+    try:
+        database._engine.dispose(close=False)
+    except TypeError:
+        # SQLAlchemy < 1.4.33 closes the connections of garbage collected
+        # pools, keep them referenced instead
+        _db_inherited.append(database)
+
+
+def _reset_after_fork():
+    """Reinitializes the locks and thread states copied from the parent."""
+    global _pinned, _filters_lock, _waiting_lock
+    Repository.connection_lock = threading.Lock()
+    _waiting_lock = threading.Lock()
+    _pinned = threading.local()
+    _filters_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 class Repository:
     """Generic repository class suitable for basic database handling."""
 
     connection_lock = threading.Lock()
+    diagnostics = False
 
     def __init__(self, model):
         """Initializes the repository.
@@ -24,13 +287,11 @@ class Repository:
             model (type): dataclass representing the database entity.
 
         """
-        # Initialisation of the connection to the database
-        self._connection_key = None
-        with self.connection_lock:
-            if not self._connection_key:
-                self._connection_key = 'default'
-                _db_connections[self._connection_key] = records.Database()
-            self._db = _db_connections[self._connection_key]
+        # The connection to the database is only opened by the first query
+        self._connection_key = 'default'
+        self._dialect = None
+        # Column sets filtered on, recorded in diagnostic mode
+        self._filters = {}
         # Entity-related attributes
         self.model = model
         self.model_name = model.__name__
@@ -41,19 +302,101 @@ class Repository:
             self.table_name = "_".join(parts).lower().strip()
 
 
+    @property
+    def _database(self):
+        """Returns the database of the current process, creating its engine
+        on first use.
+        """
+        return _get_database(self._connection_key)
+
+    @property
+    def _db(self):
+        """Returns the connection pinned to the current thread, if any, or the
+        database which checks out a pooled connection for each query.
+        """
+        pins = getattr(_pinned, 'connections', {})
+        return pins.get(self._connection_key) or self._database
+
+    @contextmanager
+    def _connection(self):
+        """Pins a pooled connection to the current thread for the duration of
+        the block, so that related queries, e.g. an insert and the retrieval
+        of its id, run on the same connection.
+        """
+        if not hasattr(_pinned, 'connections'):
+            _pinned.connections = {}
+        key = self._connection_key
+        if key in _pinned.connections:
+            yield _pinned.connections[key]
+            return
+        database = self._database
+        with _waiting_lock:
+            _db_waiting[key] = _db_waiting.get(key, 0) + 1
+        try:
+            connection = database.get_connection()
+        finally:
+            with _waiting_lock:
+                _db_waiting[key] -= 1
+        _pinned.connections[key] = connection
+        try:
+            yield connection
+        finally:
+            del _pinned.connections[key]
+            connection.close()
+
+    def pool_metrics(self):
+        """Returns usage metrics of the connection pool of the current process.
+
+        Returns:
+            dict: size of the pool, numbers of checked in, checked out and
+                overflow connections, or None if the pool does not track them,
+                and number of threads waiting for a connection to be pinned.
+                Threads waiting in single queries, which check out their
+                connection directly from the pool, are not counted.
+
+        """
+        pool = self._database._engine.pool
+        metrics = {}
+        for name, method in (('size', 'size'), ('checked_in', 'checkedin'),
+                             ('checked_out', 'checkedout'),
+                             ('overflow', 'overflow')):
+            method = getattr(pool, method, None)
+            metrics[name] = method() if callable(method) else None
+        metrics['waiting'] = _db_waiting.get(self._connection_key, 0)
+        return metrics
+
+    @property
+    def _backend(self):
+        """Returns the name of the database backend in use."""
+        engine = getattr(self._database, '_engine', None)
+        return getattr(getattr(engine, 'dialect', None), 'name', None)
+
+    @property
+    def dialect(self):
+        """Returns the dialect of the database backend in use, looked up once
+        the database is first used.
+        """
+        if self._dialect is None:
+            self._dialect = get_dialect(self._backend)
+        return self._dialect
+
+    @property
+    def _table(self):
+        """Returns the quoted table name."""
+        return self.dialect.quote(self.table_name)
+
     @property
     def _last_id(self):
         """Returns the last auto-generated ID."""
-        rows = self._db.query("""
-            SELECT LAST_INSERT_ID() as id
-        """).all(as_dict=True)
+        rows = self._db.query(self.dialect.last_id_query).all(as_dict=True)
         if len(rows) and 'id' in rows[0]:
             return rows[0]['id']
         return None
 
     def _columns(self, data):
         """Generates SQL line column selection in select or insert queries."""
-        return ", ".join([col for col in data])
+        quote = self.dialect.quote
+        return ", ".join([quote(col) for col in data])
 
     def _placeholders(self, data):
         """Generates SQL line for placeholders for values in insert queries."""
@@ -61,31 +404,92 @@ class Repository:
 
     def _where(self, data):
         """Generates SQL line for where conditions in select queries."""
-        return " AND ".join([f"{col}=:{col}" for col in data])
+        quote = self.dialect.quote
+        return " AND ".join([f"{quote(col)}=:{col}" for col in data])
 
     def _create(self, data):
         """Creates a new database entry using the given dictionnary."""
         self._db.query(f"""
-            INSERT INTO {self.table_name}({self._columns(data)})
+            INSERT INTO {self._table}({self._columns(data)})
             VALUES ({self._placeholders(data)})
         """, **data)
 
-    def _get_all(self):
+    def _create_many(self, columns, rows):
+        """Creates new database entries using executemany on the given rows."""
+        self._db.bulk_query(f"""
+            INSERT INTO {self._table}({self._columns(columns)})
+            VALUES ({self._placeholders(columns)})
+        """, rows)
+
+    def _load_data_infile(self, path, columns, terminator):
+        """Loads a CSV file server-side with MySQL's LOAD DATA LOCAL INFILE
+        and returns the number of loaded rows.
+
+        Columns mapped to None are read into a user variable and dropped.
+        Backslashes are not treated as escapes, so that values are read as
+        the csv module reads them.
+        """
+        # Deferred, see _get_database
+        from sqlalchemy import text
+        quote = self.dialect.quote
+        targets = ", ".join([
+            '@_skip' if col is None else quote(col) for col in columns
+        ])
+        terminator = terminator.replace('\r', '\\r').replace('\n', '\\n')
+        with self._database.get_engine().begin() as connection:
+            result = connection.execute(text(f"""
+                LOAD DATA LOCAL INFILE :path INTO TABLE {self._table}
+                FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+                ESCAPED BY ''
+                LINES TERMINATED BY '{terminator}' IGNORE 1 LINES
+                ({targets})
+            """), {'path': str(path)})
+            return result.rowcount
+
+    def _upsert(self, data, keys):
+        """Creates a new database entry or updates the one with the same keys.
+        """
+        self._db.query(
+            self.dialect.upsert(self.table_name, list(data), keys), **data
+        )
+
+    def _get_all(self, limit=None, offset=None):
         """Selects all the entries in the considered table."""
         return self._db.query(f"""
-            SELECT * FROM {self.table_name}
+            SELECT * FROM {self._table} {self.dialect.limit(limit, offset)}
         """).all(as_dict=True)
 
     def _get_last(self):
         """Selects the last inserted query."""
         return self._db.query(f"""
-            SELECT * FROM {self.table_name} WHERE id=:id
+            SELECT * FROM {self._table} WHERE {self._where(['id'])}
         """, id=self._last_id).all(as_dict=True)
 
-    def _get_all_by(self, data):
+    def _get_all_by(self, data, limit=None):
         """Selects all the database entries that match the given data."""
+        if self.diagnostics and data:
+            self._record_filter(data)
+        return self._db.query(f"""
+            SELECT * FROM {self._table} WHERE {self._where(data)}
+            {self.dialect.limit(limit)}
+        """, **data).all(as_dict=True)
+
+    def _record_filter(self, data):
+        """Counts the queries filtering on the columns of data and keeps the
+        first values seen as a sample to explain them.
+        """
+        columns = tuple(sorted(data))
+        with _filters_lock:
+            seen = self._filters.setdefault(
+                columns, {'calls': 0, 'params': dict(data)}
+            )
+            seen['calls'] += 1
+
+    def _explain(self, data):
+        """Returns the execution plan of the selection matching data."""
         return self._db.query(f"""
-            SELECT * FROM {self.table_name} WHERE {self._where(data)}
+            {self.dialect.explain_prefix}
+            SELECT * FROM {self._table} WHERE {self._where(data)}
         """, **data).all(as_dict=True)
 
     def create(self, **data):
@@ -95,9 +499,10 @@ class Repository:
                 value.get_or_save()
                 del data[key]
                 data[f"{key}_id"] = value.id
-        self._create(data)
-        if 'id' not in data:
-            data['id'] = self.last_id
+        with self._connection():
+            self._create(data)
+            if 'id' not in data:
+                data['id'] = self._last_id
         return self.model(**data)
 
 
@@ -110,13 +515,49 @@ class Repository:
                 value.get_or_save()
                 del data[key]
                 data[f"{key}_id"] = value.id
-        rows = self._get_all_by(data)
-        if not rows:
-            self._create(data)
-            rows = self._get_last()
+        with self._connection():
+            rows = self._get_all_by(data)
+            if not rows:
+                self._create(data)
+                rows = self._get_last()
 
         return self.model(**rows[0])
 
+    def upsert(self, conflict_keys=('id',), **data):
+        """Creates a new entry or updates the entry conflicting with it and
+        returns the corresponding instance.
+
+        The id of the returned instance is read back by selecting the entry
+        on its conflict keys, or is the last inserted id when they are not
+        all given. In the latter case, MySQL cannot tell the id of an entry
+        updated through another unique index.
+
+        Args:
+            conflict_keys (tuple): columns identifying the entry to update,
+                covered by a unique index. MySQL updates the entry conflicting
+                on any unique index and only uses them to leave them out of
+                the update.
+            **data: values of the entry.
+
+        """
+        for key, value in list(data.items()):
+            if is_model(type(value)):
+                value.get_or_save()
+                del data[key]
+                data[f"{key}_id"] = value.id
+        with self._connection():
+            self._upsert(data, conflict_keys)
+            if 'id' not in data:
+                keys = {
+                    key: data[key] for key in conflict_keys if key in data
+                }
+                if len(keys) == len(conflict_keys):
+                    rows = self._get_all_by(keys, limit=1)
+                    data['id'] = rows[0]['id'] if rows else None
+                else:
+                    data['id'] = self._last_id
+        return self.model(**data)
+
     def filter(self, **data):
         """Selects all database entries that match the given data or an empty
         list if nothing is found.
@@ -128,7 +569,7 @@ class Repository:
         """Selects the first data entry that match the given data or None if
         nothing is found.
         """
-        rows = self._get_all_by(data)
+        rows = self._get_all_by(data, limit=1)
         if rows:
             return self.model(**rows[0])
         return None
@@ -148,9 +589,10 @@ class Repository:
                 value.get_or_save()
                 del data[key]
                 data[f"{key}_id"] = value.id
-        self._create(data)
-        if not instance.id:
-            instance.id = self._last_id
+        with self._connection():
+            self._create(data)
+            if not instance.id:
+                instance.id = self._last_id
         return instance
 
     def get_or_save(self, instance):
@@ -166,10 +608,11 @@ class Repository:
                 value.get_or_save()
                 del data[key]
                 data[f"{key}_id"] = value.id
-        rows = self._get_all_by(data)
-        if not rows:
-            self._create(data)
-            rows = self._get_last()
+        with self._connection():
+            rows = self._get_all_by(data)
+            if not rows:
+                self._create(data)
+                rows = self._get_last()
         diffs = {
             k: v
             for k, v in rows[0].items()
@@ -187,53 +630,233 @@ class Repository:
             for instance in collection:
                 self.save(instance)
 
-    def get_all(self):
+    def get_all(self, limit=None, offset=None):
         """Selects all the entries of the corresponding entity in the database.
         """
-        rows = self._get_all()
+        rows = self._get_all(limit, offset)
         return [self.model(**elem) for elem in rows]
 
-class Model:
-    """Class decorator used to create models.
+    def index_report(self, sample=10):
+        """Explains the queries recorded in diagnostic mode and suggests an
+        index for those scanning the whole table.
 
-    The decorator transforms the entity into a dataclass and injects a
-    repository instance as class attribute objects as well as a save method.
+        Args:
+            sample (int): number of column sets to explain, the most
+                frequently filtered on first.
 
-    """
-    def __new__(cls, entity):
-        """Builds the decorator.
+        Returns:
+            list: QueryPlan of each explained column set.
+
+        """
+        with _filters_lock:
+            filters = sorted(
+                [(columns, dict(seen)) for columns, seen in
+                 self._filters.items()],
+                key=lambda item: item[1]['calls'], reverse=True
+            )
+        report = []
+        for columns, seen in filters[:sample]:
+            plan = self._explain(seen['params'])
+            full_scan = self.dialect.is_full_scan(plan)
+            report.append(QueryPlan(
+                table=self.table_name,
+                columns=columns,
+                calls=seen['calls'],
+                full_scan=full_scan,
+                plan=plan,
+                suggested_index=(
+                    self.dialect.create_index(self.table_name, columns)
+                    if full_scan else None
+                ),
+            ))
+        return report
+
+    def _map_columns(self, columns, mapping, known):
+        """Renames file columns to model fields and checks they all belong to
+        the known fields.
+
+        Columns mapped to None are kept as None to be ignored when loading.
+        """
+        mapping = mapping or {}
+        mapped = [mapping.get(col, col) for col in columns]
+        unknown = [
+            col for col in mapped if col is not None and col not in known
+        ]
+        if unknown:
+            raise ValueError(
+                f"Columns {', '.join(map(repr, unknown))} do not match any "
+                f"field of {self.model_name}"
+            )
+        return mapped
+
+    def _read_csv(self, path, mapping, known):
+        """Streams the rows of a CSV file with a header line as dictionaries
+        keyed by model field, skipping blank lines.
+        """
+        with open(path, newline='') as csv_file:
+            reader = csv.reader(csv_file)
+            columns = self._map_columns(next(reader, []), mapping, known)
+            for values in reader:
+                if not values:
+                    continue
+                if len(values) != len(columns):
+                    raise ValueError(
+                        f"Line {reader.line_num} of {path} has {len(values)} "
+                        f"values instead of {len(columns)}"
+                    )
+                yield {
+                    col: value
+                    for col, value in zip(columns, values)
+                    if col is not None
+                }
+
+    def _read_ndjson(self, path, mapping, known):
+        """Streams the objects of a newline-delimited JSON file as
+        dictionaries keyed by model field.
+        """
+        # Objects usually share the same keys, validated only once
+        mapped_keys = {}
+        with open(path) as json_file:
+            for number, line in enumerate(json_file, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError(
+                        f"Line {number} of {path} is not a JSON object"
+                    )
+                keys = tuple(record)
+                if keys not in mapped_keys:
+                    mapped_keys[keys] = self._map_columns(keys, mapping, known)
+                columns = mapped_keys[keys]
+                yield {
+                    col: value
+                    for col, value in zip(columns, record.values())
+                    if col is not None
+                }
+
+    def _chunks(self, rows, chunk_size):
+        """Groups consecutive rows sharing the same columns in lists of at most
+        chunk_size rows.
+        """
+        chunk = []
+        for row in rows:
+            if len(chunk) >= chunk_size or (
+                    chunk and row.keys() != chunk[0].keys()):
+                yield chunk
+                chunk = []
+            chunk.append(row)
+        if chunk:
+            yield chunk
+
+    def load_file(self, path, format='csv', mapping=None, chunk_size=None,
+                  progress=None):
+        """Bulk loads the rows of a CSV or NDJSON file in the database.
+
+        CSV files are loaded with LOAD DATA LOCAL INFILE on MySQL, which
+        requires local infile to be enabled on both client and server. Other
+        files and backends are streamed and inserted by chunks with
+        executemany.
 
         Args:
-            entity: entity klass sent to the decorator.
+            path (str): path of the file to load, CSV files need a header line.
+            format (str): format of the file, either 'csv' or 'ndjson'.
+            mapping (dict): renaming of file columns to model fields, columns
+                mapped to None are ignored.
+            chunk_size (int): number of rows inserted per executemany call,
+                defaults to the bulk insert limit of the dialect.
+            progress (callable): called with the current LoadStats after each
+                chunk.
+
+        Returns:
+            LoadStats: number of loaded rows and elapsed time.
+
+        Raises:
+            ValueError: if the format is unknown, if a column does not match
+                any field of the model, if a line of a CSV file does not have
+                as many values as the header or if a line of a NDJSON file is
+                not an object. Nothing is loaded in this case.
 
         """
-        return entity
+        readers = {'csv': self._read_csv, 'ndjson': self._read_ndjson}
+        if format not in readers:
+            raise ValueError(f"Unsupported file format: {format}")
+        chunk_size = chunk_size or self.dialect.max_bulk_rows
+        stats = LoadStats()
+        start = time.perf_counter()
+
+        known = {field.name for field in fields(self.model)}
+
+        if format == 'csv' and self.dialect.supports_load_data:
+            with open(path, newline='') as csv_file:
+                header = csv_file.readline()
+            columns = self._map_columns(
+                next(csv.reader([header]), []), mapping, known
+            )
+            terminator = '\r\n' if header.endswith('\r\n') else '\n'
+            stats.rows = self._load_data_infile(path, columns, terminator)
+            stats.seconds = time.perf_counter() - start
+            if progress:
+                progress(stats)
+            return stats
+
+        rows = readers[format](path, mapping, known)
+        with self._connection() as connection:
+            # A failed load must not leave the first chunks in the table
+            transaction = connection.transaction()
+            try:
+                for chunk in self._chunks(rows, chunk_size):
+                    self._create_many(list(chunk[0]), chunk)
+                    stats.rows += len(chunk)
+                    stats.seconds = time.perf_counter() - start
+                    if progress:
+                        progress(stats)
+            except BaseException:
+                transaction.rollback()
+                raise
+            transaction.commit()
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+def model(entity):
+    """Class decorator used to create models.
 
-    def __call__(self, **args, **kwargs):
-        self.entity = dataclass(self.entity)
+    The decorator transforms the entity into a dataclass and injects a
+    repository instance as class attribute objects as well as save and
+    get_or_save methods. Arguments annotated with another model and given an
+    id are replaced by the corresponding instance.
 
-        # Injection of a direct link to the Repository instance
-        if not hasattr(self.entity, 'objects'):
-            self.entity.objects = Repository(self.entity)
+    Args:
+        entity: entity klass sent to the decorator.
 
-        # Injection of shortcuts to the save methods of the Repository
-        self.entity.save = lambda this: entity.objects.save(this)
-        entity.get_or_save = lambda this: entity.objects.get_or_save(this)
+    """
+    entity = dataclass(entity)
 
-        entity.__init__ = self._init_wrapper
-        return entity
+    # Injection of a direct link to the Repository instance
+    if not hasattr(entity, 'objects'):
+        entity.objects = Repository(entity)
 
-    def _init_wrapper(self, this, *args, **kwargs):
-        self.entity.__init__(this, *args, **kwargs)
-        sig = signature(entity.__init__)
-        for param in sig.parameters:
-            if is_model(param.annotation):
+    # Injection of shortcuts to the save methods of the Repository
+    entity.save = lambda this: this.objects.save(this)
+    entity.get_or_save = lambda this: this.objects.get_or_save(this)
+
+    init = entity.__init__
+
+    def _init_wrapper(this, *args, **kwargs):
+        init(this, *args, **kwargs)
+        for param in signature(init).parameters.values():
+            value = getattr(this, param.name, None)
+            if (is_model(param.annotation) and value is not None
+                    and not isinstance(value, param.annotation)):
                 setattr(
-                    self,
-                    param.name, p
-                    param.annotation.objects.get(id=getattr(self, param.name))
+                    this,
+                    param.name,
+                    param.annotation.objects.get(id=value)
                 )
 
+    entity.__init__ = _init_wrapper
+    return entity
+
 
 def is_model(entity):
     if hasattr(entity, 'objects') and isinstance(entity.objects, Repository):